@@ -1,19 +1,24 @@
-import requests
+import aiohttp
+import argparse
+import asyncio
 import os
-from datetime import datetime
+import zstandard
 
-def fetch_feodo_tracker():
+from feedCache import clear_cache, create_session, fetch_lines
+from listUtils import RUN_TS, WRITE_BUFFER_SIZE
+
+# Compression level for the .zst copies of each blocklist
+ZSTD_LEVEL = 10
+
+async def fetch_feodo_tracker(session):
     """
     Fetch Feodo Tracker botnet C&C IPs from abuse.ch
     """
     url = "https://feodotracker.abuse.ch/downloads/ipblocklist.txt"
     
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        
         ips = []
-        for line in response.text.splitlines():
+        async for line in fetch_lines(session, url):
             line = line.strip()
             if not line or line.startswith('#'):
                 continue
@@ -22,11 +27,11 @@ def fetch_feodo_tracker():
         print(f"Feodo Tracker (Botnet C&C): {len(ips)} IPs")
         return ips
         
-    except requests.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         print(f"Error fetching Feodo Tracker data: {e}")
         return []
 
-def fetch_blocklist_de(category):
+async def fetch_blocklist_de(session, category):
     """
     Fetch IPs from blocklist.de by category
     Categories: ssh, mail, apache, bots, bruteforce, etc.
@@ -34,11 +39,8 @@ def fetch_blocklist_de(category):
     url = f"https://lists.blocklist.de/lists/{category}.txt"
     
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        
         ips = []
-        for line in response.text.splitlines():
+        async for line in fetch_lines(session, url):
             line = line.strip()
             if not line or line.startswith('#'):
                 continue
@@ -47,22 +49,19 @@ def fetch_blocklist_de(category):
         print(f"Blocklist.de ({category}): {len(ips)} IPs")
         return ips
         
-    except requests.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         print(f"Error fetching blocklist.de {category} data: {e}")
         return []
 
-def fetch_cinsscore_malware():
+async def fetch_cinsscore_malware(session):
     """
     Fetch malware IPs from CINS Score
     """
     url = "http://cinsscore.com/list/ci-badguys.txt"
     
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        
         ips = []
-        for line in response.text.splitlines():
+        async for line in fetch_lines(session, url):
             line = line.strip()
             if not line or line.startswith('#'):
                 continue
@@ -73,22 +72,19 @@ def fetch_cinsscore_malware():
         print(f"CINS Score (Malware): {len(ips)} IPs")
         return ips
         
-    except requests.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         print(f"Error fetching CINS Score data: {e}")
         return []
 
-def fetch_emerging_threats():
+async def fetch_emerging_threats(session):
     """
     Fetch compromised IPs from Emerging Threats
     """
     url = "https://rules.emergingthreats.net/blockrules/compromised-ips.txt"
     
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        
         ips = []
-        for line in response.text.splitlines():
+        async for line in fetch_lines(session, url):
             line = line.strip()
             if not line or line.startswith('#'):
                 continue
@@ -97,22 +93,19 @@ def fetch_emerging_threats():
         print(f"Emerging Threats (Compromised): {len(ips)} IPs")
         return ips
         
-    except requests.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         print(f"Error fetching Emerging Threats data: {e}")
         return []
 
-def fetch_spamhaus_drop():
+async def fetch_spamhaus_drop(session):
     """
     Fetch Spamhaus DROP list (hijacked/leased ranges)
     """
     url = "https://www.spamhaus.org/drop/drop.txt"
     
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        
         ips = []
-        for line in response.text.splitlines():
+        async for line in fetch_lines(session, url):
             line = line.strip()
             if not line or line.startswith(';'):
                 continue
@@ -126,7 +119,7 @@ def fetch_spamhaus_drop():
         print(f"Spamhaus DROP: {len(ips)} ranges")
         return ips
         
-    except requests.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         print(f"Error fetching Spamhaus DROP data: {e}")
         return []
 
@@ -139,37 +132,47 @@ def write_blocklist(filename, ips, title, description, sources):
     
     output_file = os.path.join(output_dir, filename)
     
-    # Deduplicate and sort
-    unique_ips = sorted(set(ips))
-    
-    with open(output_file, 'w') as f:
-        f.write(f"# {title}\n")
-        f.write(f"# Last Updated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC\n")
-        f.write(f"# Description: {description}\n")
-        f.write(f"# Format: One IP or CIDR range per line\n")
-        f.write(f"# Sources: {sources}\n")
-        f.write(f"# Total Unique Entries: {len(unique_ips)}\n")
-        f.write(f"#\n\n")
-        
-        for ip in unique_ips:
-            f.write(ip + '\n')
+    # Callers collect entries in a set, so only sorting is left
+    unique_ips = sorted(ips)
+    
+    header = (
+        f"# {title}\n"
+        f"# Last Updated: {RUN_TS} UTC\n"
+        f"# Description: {description}\n"
+        f"# Format: One IP or CIDR range per line\n"
+        f"# Sources: {sources}\n"
+        f"# Total Unique Entries: {len(unique_ips)}\n"
+        f"#\n\n"
+    )
+    body = "\n".join(unique_ips) + "\n" if unique_ips else ""
+    
+    with open(output_file, 'w', buffering=WRITE_BUFFER_SIZE) as f:
+        f.write(header)
+        f.write(body)
+    
+    # Compressed copy with identical content, for hosts that only carry the
+    # .zst files; it is a build artifact and is not committed
+    with open(output_file + '.zst', 'wb') as f:
+        with zstandard.ZstdCompressor(level=ZSTD_LEVEL, write_checksum=True).stream_writer(f, closefd=False) as compressed:
+            compressed.write(header.encode('utf-8'))
+            compressed.write(body.encode('utf-8'))
     
     print(f"✓ Created {filename} with {len(unique_ips)} entries")
     return unique_ips
 
-def build_botnet_list():
+def build_botnet_list(feodo_ips, bots_ips):
     """
     Build botnet blocklist from various sources
     """
     print("\n=== Building Botnet Blocklist ===")
     
-    all_ips = []
+    all_ips = set()
     
     # Feodo Tracker - botnet C&C
-    all_ips.extend(fetch_feodo_tracker())
+    all_ips.update(feodo_ips)
     
     # Blocklist.de bots category
-    all_ips.extend(fetch_blocklist_de('bots'))
+    all_ips.update(bots_ips)
     
     write_blocklist(
         'botnet.txt',
@@ -179,22 +182,22 @@ def build_botnet_list():
         'Feodo Tracker (abuse.ch), blocklist.de'
     )
 
-def build_malware_list():
+def build_malware_list(cins_ips, emerging_ips, spamhaus_ips):
     """
     Build malware distribution blocklist
     """
     print("\n=== Building Malware Blocklist ===")
     
-    all_ips = []
+    all_ips = set()
     
     # CINS Score malware IPs
-    all_ips.extend(fetch_cinsscore_malware())
+    all_ips.update(cins_ips)
     
     # Emerging Threats compromised hosts
-    all_ips.extend(fetch_emerging_threats())
+    all_ips.update(emerging_ips)
     
     # Spamhaus DROP (hijacked/leased networks)
-    all_ips.extend(fetch_spamhaus_drop())
+    all_ips.update(spamhaus_ips)
     
     write_blocklist(
         'malware.txt',
@@ -204,19 +207,19 @@ def build_malware_list():
         'CINS Score, Emerging Threats, Spamhaus DROP'
     )
 
-def build_abuse_list():
+def build_abuse_list(ssh_ips, mail_ips, apache_ips, bruteforce_ips):
     """
     Build abuse/spam blocklist
     """
     print("\n=== Building Abuse & Spam Blocklist ===")
     
-    all_ips = []
+    all_ips = set()
     
     # Blocklist.de various abuse categories
-    all_ips.extend(fetch_blocklist_de('ssh'))
-    all_ips.extend(fetch_blocklist_de('mail'))
-    all_ips.extend(fetch_blocklist_de('apache'))
-    all_ips.extend(fetch_blocklist_de('bruteforce'))
+    all_ips.update(ssh_ips)
+    all_ips.update(mail_ips)
+    all_ips.update(apache_ips)
+    all_ips.update(bruteforce_ips)
     
     write_blocklist(
         'abuse.txt',
@@ -226,16 +229,59 @@ def build_abuse_list():
         'blocklist.de (SSH, Mail, Apache, Bruteforce)'
     )
 
+async def fetch_all_sources():
+    """
+    Fetch every upstream feed concurrently over a shared session
+    """
+    async with create_session() as session:
+        tasks = [
+            fetch_feodo_tracker(session),
+            fetch_blocklist_de(session, 'bots'),
+            fetch_cinsscore_malware(session),
+            fetch_emerging_threats(session),
+            fetch_spamhaus_drop(session),
+            fetch_blocklist_de(session, 'ssh'),
+            fetch_blocklist_de(session, 'mail'),
+            fetch_blocklist_de(session, 'apache'),
+            fetch_blocklist_de(session, 'bruteforce'),
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    
+    # A failed source contributes nothing rather than aborting the whole run
+    ips_by_source = []
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Error processing source data: {result}")
+            ips_by_source.append([])
+        else:
+            ips_by_source.append(result)
+    
+    return ips_by_source
+
 def main():
     """
     Build all categorized blocklists
     """
+    parser = argparse.ArgumentParser(description="Build categorized IP blocklists")
+    parser.add_argument(
+        "--force-refresh",
+        action="store_true",
+        help="Ignore cached feed responses and download every source again"
+    )
+    args = parser.parse_args()
+    
+    if args.force_refresh:
+        clear_cache()
+    
     print("Starting categorized blocklist generation...")
-    print(f"Timestamp: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC\n")
+    print(f"Timestamp: {RUN_TS} UTC\n")
+    
+    (feodo_ips, bots_ips, cins_ips, emerging_ips, spamhaus_ips,
+     ssh_ips, mail_ips, apache_ips, bruteforce_ips) = asyncio.run(fetch_all_sources())
     
-    build_botnet_list()
-    build_malware_list()
-    build_abuse_list()
+    build_botnet_list(feodo_ips, bots_ips)
+    build_malware_list(cins_ips, emerging_ips, spamhaus_ips)
+    build_abuse_list(ssh_ips, mail_ips, apache_ips, bruteforce_ips)
     
     print("\n✅ All categorized blocklists have been updated!")
 
@@ -1,37 +1,32 @@
-import requests
+import aiohttp
+import argparse
+import asyncio
 import os
-from datetime import datetime
+import re
 
-def fetch_and_filter_ipsum():
+from feedCache import clear_cache, create_session, fetch_lines
+from listUtils import RUN_TS, WRITE_BUFFER_SIZE
+
+# IPsum line: "IP_ADDRESS    HIT_COUNT"; comment lines never start with a digit
+IPSUM_RE = re.compile(r'^\s*(\d{1,3}(?:\.\d{1,3}){3})\s+(\d+)')
+
+# AlienVault line: "IP # Reliability # Risk # Type # Country # Locale # Coords # x"
+ALIENVAULT_RE = re.compile(r'^\s*(\d{1,3}(?:\.\d{1,3}){3})\s*(?:#|$)')
+
+async def fetch_and_filter_ipsum(session):
     """
     Fetch IPsum threat intelligence data and filter IPs with 2 or more hits
     """
     url = "https://raw.githubusercontent.com/stamparm/ipsum/refs/heads/master/ipsum.txt"
     
     try:
-        # Fetch the data
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        
-        # Parse and filter the data
+        # Stream the data and filter it as it arrives
         filtered_ips = []
-        for line in response.text.splitlines():
-            line = line.strip()
-            
-            # Skip comments and empty lines
-            if not line or line.startswith('#'):
-                continue
-            
-            # Parse IP and hit count (format: "IP_ADDRESS    HIT_COUNT")
-            parts = line.split()
-            if len(parts) >= 2:
-                ip_address = parts[0]
-                try:
-                    hit_count = int(parts[1])
-                    if hit_count >= 2:
-                        filtered_ips.append(ip_address)
-                except ValueError:
-                    continue
+        async for line in fetch_lines(session, url):
+            # Comments and empty lines simply don't match
+            match = IPSUM_RE.match(line)
+            if match and int(match.group(2)) >= 2:
+                filtered_ips.append(match.group(1))
         
         # Create output directory if it doesn't exist
         output_dir = os.path.join(os.path.dirname(__file__), '..', 'blocklists')
@@ -39,52 +34,41 @@ def fetch_and_filter_ipsum():
         
         # Write filtered IPs to file with header
         output_file = os.path.join(output_dir, 'IPsum_latest.txt')
-        with open(output_file, 'w') as f:
+        with open(output_file, 'w', buffering=WRITE_BUFFER_SIZE) as f:
             # Write header comments
             f.write(f"# Source: {url}\n")
-            f.write(f"# Last Updated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC\n")
+            f.write(f"# Last Updated: {RUN_TS} UTC\n")
             # Write IPs
-            for ip in filtered_ips:
-                f.write(ip + '\n')
+            if filtered_ips:
+                f.write("\n".join(filtered_ips))
+                f.write("\n")
         
         print(f"Successfully created {output_file}")
         print(f"Total IPs with 2+ hits: {len(filtered_ips)}")
         
         return filtered_ips
         
-    except requests.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         print(f"Error fetching data: {e}")
         return []
     except Exception as e:
         print(f"Error processing data: {e}")
         return []
 
-def fetch_alienvault_reputation():
+async def fetch_alienvault_reputation(session):
     """
     Fetch AlienVault OTX reputation data and extract IPs
     """
     url = "https://reputation.alienvault.com/reputation.generic"
     
     try:
-        # Fetch the data
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        
-        # Parse and extract IPs
+        # Stream the data and extract IPs as it arrives
         filtered_ips = []
-        for line in response.text.splitlines():
-            line = line.strip()
-            
-            # Skip comments and empty lines
-            if not line or line.startswith('#'):
-                continue
-            
-            # Format: "IP # Reliability # Risk # Type # Country # Locale # Coords # x"
-            parts = line.split('#')
-            if len(parts) >= 1:
-                ip_address = parts[0].strip()
-                if ip_address:
-                    filtered_ips.append(ip_address)
+        async for line in fetch_lines(session, url):
+            # Comments and empty lines simply don't match
+            match = ALIENVAULT_RE.match(line)
+            if match:
+                filtered_ips.append(match.group(1))
         
         # Create output directory if it doesn't exist
         output_dir = os.path.join(os.path.dirname(__file__), 'blocklists')
@@ -92,20 +76,21 @@ def fetch_alienvault_reputation():
         
         # Write IPs to file with header
         output_file = os.path.join(output_dir, 'AlienVault_latest.txt')
-        with open(output_file, 'w') as f:
+        with open(output_file, 'w', buffering=WRITE_BUFFER_SIZE) as f:
             # Write header comments
             f.write(f"# Source: {url}\n")
-            f.write(f"# Last Updated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC\n")
+            f.write(f"# Last Updated: {RUN_TS} UTC\n")
             # Write IPs
-            for ip in filtered_ips:
-                f.write(ip + '\n')
+            if filtered_ips:
+                f.write("\n".join(filtered_ips))
+                f.write("\n")
         
         print(f"Successfully created {output_file}")
         print(f"Total IPs: {len(filtered_ips)}")
         
         return filtered_ips
         
-    except requests.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         print(f"Error fetching AlienVault data: {e}")
         return []
     except Exception as e:
@@ -117,8 +102,10 @@ def create_master_list(ipsum_ips, alienvault_ips):
     Merge all IP lists into a deduplicated master list in the root directory
     """
     try:
-        # Combine all IPs and deduplicate
-        all_ips = set(ipsum_ips + alienvault_ips)
+        # Combine into one set so overlapping entries are only stored once
+        all_ips = set()
+        all_ips.update(ipsum_ips)
+        all_ips.update(alienvault_ips)
         
         # Sort IPs for consistent output
         sorted_ips = sorted(all_ips)
@@ -127,15 +114,16 @@ def create_master_list(ipsum_ips, alienvault_ips):
         root_dir = os.path.dirname(os.path.dirname(__file__))
         output_file = os.path.join(root_dir, 'primary_blocklist.txt')
         
-        with open(output_file, 'w') as f:
+        with open(output_file, 'w', buffering=WRITE_BUFFER_SIZE) as f:
             # Write header
             f.write(f"# Primary IP Blocklist\n")
             f.write(f"# Sources: IPsum (2+ hits), AlienVault OTX\n")
-            f.write(f"# Last Updated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC\n")
+            f.write(f"# Last Updated: {RUN_TS} UTC\n")
             f.write(f"# Total Unique IPs: {len(sorted_ips)}\n")
             # Write IPs
-            for ip in sorted_ips:
-                f.write(ip + '\n')
+            if sorted_ips:
+                f.write("\n".join(sorted_ips))
+                f.write("\n")
         
         print(f"\nSuccessfully created primary blocklist: {output_file}")
         print(f"Total unique IPs in primary list: {len(sorted_ips)}")
@@ -146,7 +134,28 @@ def create_master_list(ipsum_ips, alienvault_ips):
     except Exception as e:
         print(f"Error creating primary list: {e}")
 
-if __name__ == "__main__":
-    ipsum_ips = fetch_and_filter_ipsum()
-    alienvault_ips = fetch_alienvault_reputation()
+async def main():
+    """
+    Fetch both threat feeds concurrently, then build the primary list
+    """
+    async with create_session() as session:
+        ipsum_ips, alienvault_ips = await asyncio.gather(
+            fetch_and_filter_ipsum(session),
+            fetch_alienvault_reputation(session),
+        )
+    
     create_master_list(ipsum_ips, alienvault_ips)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the primary IP blocklist")
+    parser.add_argument(
+        "--force-refresh",
+        action="store_true",
+        help="Ignore cached feed responses and download every source again"
+    )
+    args = parser.parse_args()
+    
+    if args.force_refresh:
+        clear_cache()
+    
+    asyncio.run(main())
@@ -0,0 +1,145 @@
+import aiohttp
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+
+# Responses are kept next to the build scripts, keyed by a hash of the feed URL
+CACHE_DIR = os.path.join(os.path.dirname(__file__), '.blocklist_cache')
+
+# Entries younger than this are reused without contacting the server at all
+CACHE_MAX_AGE = 3600
+
+# Transient failures are retried with exponential backoff before giving up
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.3
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def create_session():
+    """
+    Create the session shared by every fetch in a run
+
+    One pooled connector keeps connections alive, so repeated requests to
+    the same host (e.g. the blocklist.de categories) reuse TCP+TLS sessions.
+    """
+    connector = aiohttp.TCPConnector(limit=32, limit_per_host=4)
+    timeout = aiohttp.ClientTimeout(total=30)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+def _cache_paths(url):
+    """
+    Return the (body, metadata) file paths used to cache a URL
+    """
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return (os.path.join(CACHE_DIR, f"{key}.body"),
+            os.path.join(CACHE_DIR, f"{key}.json"))
+
+def _read_meta(url):
+    """
+    Return the cached metadata for a URL, or None if it has no cached body
+    """
+    body_path, meta_path = _cache_paths(url)
+    if not os.path.exists(body_path):
+        return None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_meta(url, meta):
+    """
+    Store the validators and fetch time for a URL
+    """
+    _, meta_path = _cache_paths(url)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+def _iter_cached_lines(url):
+    """
+    Yield the lines of a cached body from disk
+    """
+    body_path, _ = _cache_paths(url)
+    with open(body_path, 'r', encoding='utf-8') as f:
+        yield from f
+
+def clear_cache():
+    """
+    Drop every cached response so the next run downloads all feeds again
+    """
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+async def _get_with_retries(session, url, headers):
+    """
+    Send a GET, retrying connection errors and retryable statuses
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = await session.get(url, headers=headers)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt == MAX_RETRIES:
+                raise
+        else:
+            if response.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                return response
+            response.release()
+        
+        await asyncio.sleep(BACKOFF_FACTOR * (2 ** attempt))
+
+async def fetch_lines(session, url):
+    """
+    Fetch a URL with the shared session and yield the body line by line
+
+    Uses the on-disk cache: fresh entries are read straight from disk, stale
+    ones are revalidated with If-None-Match / If-Modified-Since so an
+    unchanged feed costs a 304 instead of a full download. New bodies are
+    streamed into the cache as they are yielded, never held in memory whole.
+    """
+    meta = _read_meta(url)
+
+    if meta is not None and time.time() - meta.get('fetched', 0) < CACHE_MAX_AGE:
+        for line in _iter_cached_lines(url):
+            yield line
+        return
+
+    headers = {}
+    if meta is not None:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    body_path, _ = _cache_paths(url)
+    partial_path = body_path + '.part'
+    not_modified = False
+
+    async with await _get_with_retries(session, url, headers) as response:
+        if response.status == 304 and meta is not None:
+            not_modified = True
+        else:
+            response.raise_for_status()
+            encoding = response.charset or 'utf-8'
+            meta = {
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(partial_path, 'w', encoding='utf-8') as cache_file:
+                async for raw in response.content:
+                    line = raw.decode(encoding, errors='replace')
+                    cache_file.write(line)
+                    yield line
+
+            # Only a completely received body replaces the cached copy
+            os.replace(partial_path, body_path)
+
+    meta['fetched'] = time.time()
+    _write_meta(url, meta)
+
+    if not_modified:
+        for line in _iter_cached_lines(url):
+            yield line
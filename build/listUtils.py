@@ -0,0 +1,7 @@
+from datetime import datetime, timezone
+
+# Formatted once so every header and log line of a run shows the same time
+RUN_TS = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+# Lists are emitted with a single write, so give the file a large buffer
+WRITE_BUFFER_SIZE = 1 << 20
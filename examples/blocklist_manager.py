@@ -5,82 +5,438 @@ Description: Python utility for managing and applying IP blocklists
 Usage: python blocklist_manager.py [options]
 """
 
+import codecs
+import hashlib
 import ipaddress
 import json
+import os
 import sys
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Set, List, Tuple, Union
+from typing import Dict, Iterator, Set, List, Optional, Tuple, Union
 import argparse
 
+import numpy as np
+
+
+def _compressed_path(filepath: Path) -> Path:
+    """Return the path of the zstd-compressed copy of a blocklist file."""
+    return filepath.with_suffix(filepath.suffix + ".zst")
+
+
+def _source_path(filepath: Path) -> Path:
+    """Return the file actually read for a blocklist.
+    
+    The .txt is authoritative: it is the file the repo commits, while .zst
+    copies are uncommitted build artifacts for hosts that carry only those.
+    A .zst copy is therefore only read when its .txt is absent.
+    """
+    return filepath if filepath.exists() else _compressed_path(filepath)
+
+
+def _iter_compressed_lines(source: Path) -> Iterator[str]:
+    """Stream-decompress a .zst blocklist copy and yield its lines.
+    
+    zstandard is only needed for lists shipped as a .zst alone, so it is
+    imported here. Damaged data raises ValueError, like undecodable text.
+    """
+    import zstandard
+    
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = ""
+    try:
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(zstandard.DECOMPRESSION_RECOMMENDED_INPUT_SIZE), b''):
+                lines = (pending + decoder.decode(decompressor.decompress(chunk))).split('\n')
+                pending = lines.pop()
+                yield from lines
+    except zstandard.ZstdError as e:
+        raise ValueError(f"corrupt zstd data: {e}") from e
+        
+    # A cut-off copy decompresses cleanly up to the cut, so the frame must end
+    if not decompressor.eof:
+        raise ValueError("truncated zstd data")
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+def _iter_lines(filepath: Path) -> Iterator[str]:
+    """Yield the lines of a blocklist, decompressing its .zst copy if there is no .txt."""
+    source = _source_path(filepath)
+    if source != filepath:
+        yield from _iter_compressed_lines(source)
+    else:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            yield from f
+
+
+def _network_key(network: Union[ipaddress.IPv4Network, ipaddress.IPv6Network]) -> Tuple[int, int]:
+    """Sort key matching network ordering, far cheaper than comparing network objects."""
+    return int(network.network_address), network.prefixlen
+
+
+def _parse_file(filepath: Path) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+    """Parse a blocklist file into IPv4 and IPv6 (network address, prefix length) entries.
+    
+    Kept at module level so worker processes can run it; plain int tuples
+    pickle far more cheaply than ipaddress objects. Entries are split by
+    version here, while the line is parsed, so nothing downstream has to
+    partition them again.
+    """
+    v4_entries: List[Tuple[int, int]] = []
+    v6_entries: List[Tuple[int, int]] = []
+    try:
+        for line_num, line in enumerate(_iter_lines(filepath), 1):
+            line = line.strip()
+            
+            # Skip empty lines and comments
+            if not line or line.startswith('#'):
+                continue
+            
+            try:
+                # Pick the constructor up front instead of letting
+                # ip_network() try IPv4 and fall back to IPv6
+                if ':' in line:
+                    network = ipaddress.IPv6Network(line, strict=False)
+                    v6_entries.append((int(network.network_address), network.prefixlen))
+                elif '/' in line:
+                    network = ipaddress.IPv4Network(line, strict=False)
+                    v4_entries.append((int(network.network_address), network.prefixlen))
+                else:
+                    v4_entries.append((int(ipaddress.IPv4Address(line)), 32))
+            except ValueError as e:
+                print(f"Warning: Invalid IP at line {line_num} of {filepath.name}: {line} - {e}")
+            
+    except ValueError as e:
+        # A damaged or undecodable file must not abort the whole load; skip it like a missing list
+        print(f"Warning: Could not read {_source_path(filepath).name}: {e}")
+        return [], []
+            
+    return v4_entries, v6_entries
+
 
 class BlocklistManager:
     """Manage IP blocklists with validation and filtering capabilities."""
     
+    # Parsed networks are added to the set in batches of this size
+    LOAD_BATCH_SIZE = 4096
+    
+    # Exports are written in a few large chunks, so give the file a large buffer
+    WRITE_BUFFER_SIZE = 1 << 20
+    
+    # Text export formats as (header, per-network line formatter, footer)
+    EXPORT_TEMPLATES = {
+        "plain": ("", "{}\n".format, ""),
+        "iptables": (
+            "#!/bin/bash\n# Generated iptables rules\n\n",
+            "iptables -A INPUT -s {} -j DROP\n".format,
+            ""
+        ),
+        "nginx": (
+            "# Generated nginx geo block\ngeo $blocked_ip {\n    default 0;\n",
+            "    {} 1;\n".format,
+            "}\n"
+        ),
+        "apache": (
+            "# Generated Apache blocklist\n<RequireAll>\n    Require all granted\n",
+            "    Require not ip {}\n".format,
+            "</RequireAll>\n"
+        ),
+    }
+    
+    # Parsed snapshot of the directory, reused while no blocklist file changes
+    SNAPSHOT_DIR = ".cache"
+    SNAPSHOT_VERSION = 2
+    
     def __init__(self, blocklist_dir: str = "../blocklists"):
         self.blocklist_dir = Path(blocklist_dir)
         self.blocked_ips: Set[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]] = set()
+        # The same networks partitioned by version, sorted lazily when dirty
+        self._v4_networks: List[ipaddress.IPv4Network] = []
+        self._v6_networks: List[ipaddress.IPv6Network] = []
+        self._sorted_dirty = False
+        # Lookup index per IP version, rebuilt lazily after the blocklist changes.
+        # IPv4 is (starts, ends, prefixlens) uint32 arrays; IPv6 bounds stay
+        # Python ints (128-bit) alongside the matching networks.
+        self._index: Optional[Dict[int, tuple]] = None
+        # Sorted, deduplicated IPv4 keys (address << 8 | prefixlen) from parsed
+        # files or a snapshot, turned into IPv4Network objects only once
+        # something needs more than the lookup index. While keys are pending,
+        # no IPv4 network objects exist.
+        self._pending_v4: Optional[np.ndarray] = None
+        
+    def _materialize_pending(self) -> None:
+        """Create the IPv4 network objects for the pending keys."""
+        if self._pending_v4 is None:
+            return
+            
+        # Keys are kept sorted, and nothing else is in the list yet
+        networks = [ipaddress.IPv4Network((key >> 8, key & 0xFF))
+                    for key in self._pending_v4.tolist()]
+        self._pending_v4 = None
+        self._v4_networks.extend(networks)
+        self.blocked_ips.update(networks)
+        
+    def _add_networks(self, networks: list, version_networks: list) -> None:
+        """Add networks of a single IP version to the set and that version's list."""
+        new_networks = set(networks).difference(self.blocked_ips)
+        if not new_networks:
+            return
+            
+        self.blocked_ips.update(new_networks)
+        version_networks.extend(new_networks)
+        
+        self._sorted_dirty = True
+        self._index = None
+        
+    def _add_batched(self, entries: List[Tuple[int, int]], network_type: type,
+                     version_networks: list) -> None:
+        """Rebuild network objects from parsed entries and add them in batches."""
+        for start in range(0, len(entries), self.LOAD_BATCH_SIZE):
+            batch = list(map(network_type, entries[start:start + self.LOAD_BATCH_SIZE]))
+            self._add_networks(batch, version_networks)
+            
+    def _add_entries(self, parsed: Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]) -> int:
+        """Add parsed IPv4/IPv6 entries and return the entry count."""
+        v4_entries, v6_entries = parsed
+        
+        if self._v4_networks:
+            # Network objects already exist, so new ones have to join them
+            self._add_batched(v4_entries, ipaddress.IPv4Network, self._v4_networks)
+        elif v4_entries:
+            # Otherwise IPv4 stays as int keys; np.union1d sorts and dedupes
+            rows = np.array(v4_entries, dtype=np.int64)
+            keys = (rows[:, 0] << 8) | rows[:, 1]
+            self._pending_v4 = np.union1d(keys if self._pending_v4 is None else self._pending_v4, keys)
+            self._index = None
+            
+        self._add_batched(v6_entries, ipaddress.IPv6Network, self._v6_networks)
+        return len(v4_entries) + len(v6_entries)
         
     def load_blocklist(self, filename: str) -> int:
         """Load IPs from a blocklist file."""
         filepath = self.blocklist_dir / filename
         
-        if not filepath.exists():
+        if not _source_path(filepath).exists():
             print(f"Error: Blocklist file not found: {filepath}")
             return 0
             
-        count = 0
-        with open(filepath, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                
-                # Skip empty lines and comments
-                if not line or line.startswith('#'):
-                    continue
-                
-                try:
-                    # Parse IP or network
-                    network = ipaddress.ip_network(line, strict=False)
-                    self.blocked_ips.add(network)
-                    count += 1
-                except ValueError as e:
-                    print(f"Warning: Invalid IP at line {line_num}: {line} - {e}")
-                    
-        return count
+        return self._add_entries(_parse_file(filepath))
+    
+    def _snapshot_key(self, files: List[Path]) -> str:
+        """Fingerprint the blocklist files by name, size and change times.
+        
+        The inode change time is included because a rewrite can restore the
+        mtime (checkouts, ``touch -r``, archive extraction), but not the ctime.
+        """
+        stats = []
+        for f in (_source_path(f) for f in files):
+            st = f.stat()
+            stats.append((f.name, st.st_size, st.st_mtime_ns, st.st_ctime_ns))
+        stats.sort()
+        return hashlib.sha256(repr((self.SNAPSHOT_VERSION, stats)).encode()).hexdigest()
+    
+    def _load_snapshot(self, key: str) -> Optional[int]:
+        """Restore the parsed blocklists from a matching snapshot, returning the entry count."""
+        snapshot_dir = self.blocklist_dir / self.SNAPSHOT_DIR
+        try:
+            with open(snapshot_dir / "meta.json", 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("key") != key:
+                return None
+            v4_keys = np.load(snapshot_dir / "v4_networks.npy", mmap_mode='r')
+            v4_index = np.load(snapshot_dir / "v4_index.npy", mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+            
+        self._v6_networks = [ipaddress.IPv6Network(n) for n in meta["v6_networks"]]
+        self.blocked_ips.update(self._v6_networks)
+        self._pending_v4 = v4_keys
+        self._index = {
+            4: (v4_index[0], v4_index[1], v4_index[2]),
+            6: self._intervals(self._v6_networks),
+        }
+        return meta["total"]
+    
+    def _save_snapshot(self, key: str, total: int) -> None:
+        """Write the parsed blocklists so the next run can skip parsing."""
+        # Both arrays come straight from the int keys, no network objects needed
+        if self._index is None:
+            self._build_index()
+        starts, ends, prefixlens = self._index[4]
+        keys = self._v4_keys()
+        
+        snapshot_dir = self.blocklist_dir / self.SNAPSHOT_DIR
+        try:
+            snapshot_dir.mkdir(exist_ok=True)
+            np.save(snapshot_dir / "v4_networks.npy", keys)
+            np.save(snapshot_dir / "v4_index.npy", np.stack([starts, ends, prefixlens]))
+            # Written last: a snapshot only counts once its key is in place
+            with open(snapshot_dir / "meta.json", 'w', encoding='utf-8') as f:
+                json.dump({
+                    "key": key,
+                    "total": total,
+                    "v6_networks": [str(n) for n in self._v6_networks]
+                }, f)
+        except OSError as e:
+            print(f"Warning: Could not write blocklist snapshot: {e}")
     
     def load_all_blocklists(self) -> int:
         """Load all blocklist files from the blocklist directory."""
         total = 0
+        files = list(self.blocklist_dir.glob("*.txt"))
+        # Lists shipped only in compressed form are loaded from their .zst
+        files += [c.with_suffix("") for c in self.blocklist_dir.glob("*.txt.zst")
+                  if not c.with_suffix("").exists()]
+        if not files:
+            return total
         
-        for file in self.blocklist_dir.glob("*.txt"):
-            print(f"Loading {file.name}...")
-            count = self.load_blocklist(file.name)
-            print(f"  Loaded {count} entries")
-            total += count
+        # A snapshot only describes the directory by itself, so it is
+        # neither used nor written once other lists have been loaded
+        use_snapshot = not self.blocked_ips and self._pending_v4 is None
+        if use_snapshot:
+            key = self._snapshot_key(files)
+            total = self._load_snapshot(key)
+            if total is not None:
+                print(f"Loaded {len(files)} blocklists from snapshot")
+                return total
+            total = 0
+        
+        # Parsing is CPU-bound, so spread the files over worker processes
+        with ProcessPoolExecutor(max_workers=min(len(files), os.cpu_count() or 1)) as executor:
+            for file, parsed in zip(files, executor.map(_parse_file, files)):
+                print(f"Loading {file.name}...")
+                count = self._add_entries(parsed)
+                print(f"  Loaded {count} entries")
+                total += count
+                
+        if use_snapshot:
+            self._save_snapshot(key, total)
             
         return total
     
+    @staticmethod
+    def _intervals(networks: list) -> Tuple[List[int], List[int], list]:
+        """Collapse sorted networks into non-overlapping (start, end, network) intervals."""
+        starts: List[int] = []
+        ends: List[int] = []
+        matches = []
+        
+        # Sorted networks order by address, broader blocks first on ties
+        for network in networks:
+            start = int(network.network_address)
+            # CIDR blocks either nest or are disjoint, so a block starting
+            # inside the previous interval is already covered by it
+            if ends and start <= ends[-1]:
+                continue
+            starts.append(start)
+            ends.append(int(network.broadcast_address))
+            matches.append(network)
+            
+        return starts, ends, matches
+    
+    @staticmethod
+    def _v4_intervals(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Collapse sorted IPv4 keys into non-overlapping (start, end, prefixlen) arrays."""
+        starts = keys >> 8
+        prefixlens = keys & 0xFF
+        ends = starts + (np.int64(1) << (32 - prefixlens)) - 1
+        
+        # Same rule as _intervals: a block starting inside an earlier one is
+        # nested in it, and the earlier blocks' running maximum end is exactly
+        # where the last kept interval ends
+        keep = np.ones(len(keys), dtype=bool)
+        keep[1:] = starts[1:] > np.maximum.accumulate(ends)[:-1]
+        
+        return (starts[keep].astype(np.uint32),
+                ends[keep].astype(np.uint32),
+                prefixlens[keep].astype(np.uint32))
+    
+    def _v4_keys(self) -> np.ndarray:
+        """Return every IPv4 network as a sorted address << 8 | prefixlen key."""
+        if self._pending_v4 is not None:
+            return self._pending_v4
+        return np.sort(np.array([(int(n.network_address) << 8) | n.prefixlen
+                                 for n in self._v4_networks], dtype=np.int64))
+    
+    def _build_index(self) -> None:
+        """Build sorted, non-overlapping address intervals for each IP version."""
+        # Sorted in place: a snapshot saves the IPv6 list in this order
+        self._v6_networks.sort(key=_network_key)
+        self._index = {
+            4: self._v4_intervals(self._v4_keys()),
+            6: self._intervals(self._v6_networks),
+        }
+    
+    def _lookup(self, ip: Union[ipaddress.IPv4Address, ipaddress.IPv6Address]) -> Tuple[bool, str]:
+        """Find the blocked network containing a parsed IP address."""
+        if self._index is None:
+            self._build_index()
+        value = int(ip)
+        if ip.version == 4:
+            starts, ends, prefixlens = self._index[4]
+            pos = int(np.searchsorted(starts, value, side='right')) - 1
+            if pos >= 0 and value <= ends[pos]:
+                return True, f"{ipaddress.IPv4Address(int(starts[pos]))}/{prefixlens[pos]}"
+        else:
+            starts, ends, matches = self._index[6]
+            pos = bisect_right(starts, value) - 1
+            if pos >= 0 and value <= ends[pos]:
+                return True, str(matches[pos])
+            
+        return False, ""
+    
     def is_blocked(self, ip_address: str) -> Tuple[bool, str]:
         """Check if an IP address is in the blocklist."""
         try:
-            ip = ipaddress.ip_address(ip_address)
-            
-            for network in self.blocked_ips:
-                if ip in network:
-                    return True, str(network)
-                    
-            return False, ""
-            
+            return self._lookup(ipaddress.ip_address(ip_address))
         except ValueError as e:
             return False, f"Invalid IP: {e}"
     
+    def _check_batch(self, ip_list: List[str]) -> List[Tuple[bool, str]]:
+        """Check many IPs at once, resolving all IPv4 lookups in one vectorized pass."""
+        results: List[Tuple[bool, str]] = [(False, "")] * len(ip_list)
+        v4_positions: List[int] = []
+        v4_values: List[int] = []
+        
+        for i, ip_address in enumerate(ip_list):
+            try:
+                ip = ipaddress.ip_address(ip_address)
+            except ValueError as e:
+                results[i] = (False, f"Invalid IP: {e}")
+                continue
+            if ip.version == 4:
+                v4_positions.append(i)
+                v4_values.append(int(ip))
+            else:
+                results[i] = self._lookup(ip)
+                
+        if self._index is None:
+            self._build_index()
+        starts, ends, prefixlens = self._index[4]
+        
+        if v4_values and len(starts):
+            queries = np.array(v4_values, dtype=np.uint32)
+            pos = np.searchsorted(starts, queries, side='right') - 1
+            hits = (pos >= 0) & (queries <= ends[pos.clip(0)])
+            
+            matched = pos[hits]
+            for i, start, prefixlen in zip(np.asarray(v4_positions)[hits].tolist(),
+                                           starts[matched].tolist(), prefixlens[matched].tolist()):
+                results[i] = (True, f"{ipaddress.IPv4Address(start)}/{prefixlen}")
+                
+        return results
+    
     def check_list(self, ip_list: List[str]) -> None:
         """Check a list of IPs against the blocklist."""
         print("\nChecking IP addresses against blocklist:")
         print("-" * 60)
         
         blocked_count = 0
-        for ip in ip_list:
-            is_blocked, reason = self.is_blocked(ip)
+        for ip, (is_blocked, reason) in zip(ip_list, self._check_batch(ip_list)):
             status = "BLOCKED" if is_blocked else "ALLOWED"
             
             if is_blocked:
@@ -95,59 +451,42 @@ class BlocklistManager:
     
     def _sort_networks(self) -> List[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]:
         """Sort networks, separating IPv4 and IPv6."""
-        ipv4_networks = sorted([n for n in self.blocked_ips if n.version == 4])
-        ipv6_networks = sorted([n for n in self.blocked_ips if n.version == 6])
-        return ipv4_networks + ipv6_networks
+        self._materialize_pending()
+        if self._sorted_dirty:
+            self._v4_networks.sort(key=_network_key)
+            self._v6_networks.sort(key=_network_key)
+            self._sorted_dirty = False
+        return self._v4_networks + self._v6_networks
     
     def export_to_format(self, output_file: str, format_type: str = "plain") -> None:
         """Export blocklist to different formats."""
         sorted_networks = self._sort_networks()
         
-        with open(output_file, 'w', encoding='utf-8') as f:
-            if format_type == "plain":
-                for network in sorted_networks:
-                    f.write(f"{network}\n")
-                    
-            elif format_type == "iptables":
-                f.write("#!/bin/bash\n")
-                f.write("# Generated iptables rules\n\n")
-                for network in sorted_networks:
-                    f.write(f"iptables -A INPUT -s {network} -j DROP\n")
-                    
-            elif format_type == "nginx":
-                f.write("# Generated nginx geo block\n")
-                f.write("geo $blocked_ip {\n")
-                f.write("    default 0;\n")
-                for network in sorted_networks:
-                    f.write(f"    {network} 1;\n")
-                f.write("}\n")
-                
-            elif format_type == "apache":
-                f.write("# Generated Apache blocklist\n")
-                f.write("<RequireAll>\n")
-                f.write("    Require all granted\n")
-                for network in sorted_networks:
-                    f.write(f"    Require not ip {network}\n")
-                f.write("</RequireAll>\n")
-                
-            elif format_type == "json":
+        with open(output_file, 'w', encoding='utf-8', buffering=self.WRITE_BUFFER_SIZE) as f:
+            if format_type == "json":
                 data = {
                     "blocked_ips": [str(ip) for ip in sorted_networks],
                     "total_count": len(self.blocked_ips)
                 }
-                json.dump(data, f, indent=2)
+                f.write(json.dumps(data, indent=2))
+                
+            elif format_type in self.EXPORT_TEMPLATES:
+                header, line_format, footer = self.EXPORT_TEMPLATES[format_type]
+                f.write(header)
+                f.write("".join(map(line_format, sorted_networks)))
+                f.write(footer)
                 
         print(f"Exported {len(self.blocked_ips)} entries to {output_file} ({format_type} format)")
     
     def get_statistics(self) -> dict:
         """Get statistics about loaded blocklists."""
-        ipv4_count = sum(1 for ip in self.blocked_ips if ip.version == 4)
-        ipv6_count = sum(1 for ip in self.blocked_ips if ip.version == 6)
+        # Counting doesn't need the pending IPv4 networks materialized
+        pending = 0 if self._pending_v4 is None else len(self._pending_v4)
         
         return {
-            "total": len(self.blocked_ips),
-            "ipv4": ipv4_count,
-            "ipv6": ipv6_count
+            "total": len(self.blocked_ips) + pending,
+            "ipv4": len(self._v4_networks) + pending,
+            "ipv6": len(self._v6_networks)
         }
 
 